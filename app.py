@@ -1,10 +1,14 @@
+import re
+import time
 import streamlit as st
 import pandas as pd
+import numpy as np
+from pandas.api.types import union_categoricals
 from google.oauth2.service_account import Credentials
 import gspread
+from gspread.utils import fill_gaps
 from rapidfuzz import fuzz, process
 from datetime import timedelta
-import matplotlib.pyplot as plt
 from googleapiclient.discovery import build
 
 st.set_page_config(page_title="Inventory Dashboard", layout="wide")
@@ -18,59 +22,285 @@ SCOPES = [
     "https://www.googleapis.com/auth/drive",
 ]
 
-creds = Credentials.from_service_account_info(SERVICE_ACCOUNT_INFO, scopes=SCOPES)
-gc = gspread.authorize(creds)
+@st.cache_resource(show_spinner=False)
+def get_google_clients():
+    creds = Credentials.from_service_account_info(SERVICE_ACCOUNT_INFO, scopes=SCOPES)
+    return creds, gspread.authorize(creds)
+
+creds, gc = get_google_clients()
+
+@st.cache_resource(show_spinner=False)
+def get_spreadsheet():
+    return gc.open_by_key(SPREADSHEET_ID)
+
+def get_drive_service():
+    # Built per use, not cached: the service's httplib2 transport is not thread-safe and
+    # sessions run on separate threads. The bundled discovery document keeps this cheap.
+    return build("drive", "v3", credentials=creds, cache_discovery=False, static_discovery=True)
 
 # ---- Helpers for Google Sheets ----
-def fetch_sheet_df(sheet_name, req_cols=None, label=""):
+@st.cache_data(ttl=60, show_spinner=False)
+def _spreadsheet_modified_time():
+    # Failures return None so they are cached too; Drive is asked at most once a minute
     try:
-        sh = gc.open_by_key(SPREADSHEET_ID)
-        ws = sh.worksheet(sheet_name)
-        data = ws.get_all_values()
-    except Exception as e:
-        st.error(f"Error fetching '{sheet_name}': {e}")
+        return get_drive_service().files().get(
+            fileId=SPREADSHEET_ID, fields="modifiedTime", supportsAllDrives=True
+        ).execute()["modifiedTime"]
+    except Exception:
         return None
 
+def spreadsheet_version():
+    # Drive modifiedTime of the workbook; without it, a 5-minute time bucket bounds staleness
+    return _spreadsheet_modified_time() or f"bucket-{int(time.time() // 300)}"
+
+class SheetError(Exception):
+    pass
+
+# Keyed on spreadsheet_version(), so sheets are refetched only after the workbook changes.
+# Failures raise instead of returning None so they are never cached; a missing tab is
+# left out of the result instead, so that outcome is cached with the rest.
+@st.cache_data(ttl=3600, max_entries=5, show_spinner=False)
+def _fetch_sheet_values(sheet_names, version):
+    # One values:batchGet request for every sheet instead of a round-trip per sheet
+    spreadsheet = get_spreadsheet()
+    try:
+        response = spreadsheet.values_batch_get([f"'{name}'" for name in sheet_names])
+    except gspread.exceptions.APIError:
+        # A missing or renamed tab fails the whole batch; retry with only the tabs that exist
+        titles = {ws.title for ws in spreadsheet.worksheets()}
+        existing = tuple(name for name in sheet_names if name in titles)
+        if len(existing) == len(sheet_names):
+            raise
+        sheet_names = existing
+        if not sheet_names:
+            return {}
+        response = spreadsheet.values_batch_get([f"'{name}'" for name in sheet_names])
+    return {
+        name: fill_gaps(vr["values"]) if vr.get("values") else []
+        for name, vr in zip(sheet_names, response["valueRanges"])
+    }
+
+@st.cache_data(ttl=3600, max_entries=20, show_spinner=False)
+def _load_sheet_df(sheet_name, req_cols, label, version):
+    data = _fetch_sheet_values(SHEET_NAMES, version).get(sheet_name)
+    if data is None:
+        raise SheetError(f"Sheet '{sheet_name}' was not found in the spreadsheet.")
     if len(data) < 2:
-        st.error(f"Sheet '{sheet_name}' is empty or missing header/data.")
-        return None
+        raise SheetError(f"Sheet '{sheet_name}' is empty or missing header/data.")
     df = pd.DataFrame(data[1:], columns=data[0])
     df.columns = df.columns.str.strip()
     if req_cols:
         missing = [c for c in req_cols if c not in df.columns]
         if missing:
-            st.error(f"{label} is missing required columns: {missing}")
-            return None
-    df["Design No"] = df["Design No"].astype(str)
-    if "Barcode" in df.columns:
-        df["Barcode"] = df["Barcode"].astype(str)
-    if "Closing Qty" in df.columns:
-        df["Closing Qty"] = pd.to_numeric(df["Closing Qty"], errors="coerce").fillna(0).astype(int)
-    if "Quantity" in df.columns:
-        df["Quantity"] = pd.to_numeric(df["Quantity"], errors="coerce").fillna(0).astype(int)
-    if "Created at" in df.columns:
-        df["Created at"] = pd.to_datetime(df["Created at"], errors="coerce")
+            raise SheetError(f"{label} is missing required columns: {missing}")
+    # Cells arrive as str, so key columns go straight to category
+    for col in [c for c in KEY_COLS if c in df.columns]:
+        df[col] = df[col].astype("category")
+    for col in [c for c in QTY_COLS if c in df.columns]:
+        df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0).astype(np.int32)
+    for col in [c for c in DATE_COLS if c in df.columns]:
+        df[col] = pd.to_datetime(df[col], errors="coerce")
     return df
 
-def fuzzy_best_match(query, choices):
+def fetch_sheet_df(sheet_name, req_cols=None, label="", version=None):
+    try:
+        return _load_sheet_df(sheet_name, req_cols, label, version)
+    except SheetError as e:
+        st.error(str(e))
+    except Exception as e:
+        st.error(f"Error fetching '{sheet_name}': {e}")
+    return None
+
+def align_categories(dfs, cols):
+    # Give each categorical column one shared category set across frames so that
+    # cross-frame concat/merge/isin operate on integer codes
+    dfs = [df for df in dfs if df is not None]
+    for col in cols:
+        if dfs:
+            cats = union_categoricals([df[col] for df in dfs]).categories
+            for df in dfs:
+                df[col] = df[col].cat.set_categories(cats)
+
+# Aggregates below are keyed on the sheet names they were given and sheet_version;
+# the underscored frames are not hashed
+@st.cache_data(ttl=3600, max_entries=5, show_spinner=False)
+def build_inventory_overview(_sources, source_names, version):
+    key_cols = ["Design No", "Barcode", "Color", "Size"]
+    # Include missing columns if not found
+    frames = [df.reindex(columns=key_cols + ["Closing Qty"], fill_value="").assign(Source=label) for label, df in _sources]
+    # One groupby over all sources, pivoted to a <Source>_Qty column per source
+    merged = (
+        pd.concat(frames, ignore_index=True)
+        .groupby(key_cols + ["Source"], sort=False, observed=True, dropna=False)["Closing Qty"].sum()
+        .unstack("Source", fill_value=0)
+        .reindex(columns=list(source_names), fill_value=0)
+        .add_suffix("_Qty")
+        .rename_axis(columns=None)
+        .reset_index()
+    )
+    qty_cols = [c for c in merged.columns if c.endswith("_Qty")]
+    merged["Total_QTY"] = merged[qty_cols].sum(axis=1)
+    return merged, qty_cols
+
+@st.cache_data(ttl=3600, max_entries=5, show_spinner=False)
+def classify_recent_sales(_orders_df, version):
+    max_date = _orders_df["Created at"].max()
+    if pd.isnull(max_date):
+        return [], []
+    cutoff = max_date - timedelta(days=3)
+    recent = _orders_df[_orders_df["Created at"] >= cutoff]
+    sales = recent.groupby("Design No", sort=False, observed=True)["Quantity"].sum()
+    reorder_designs = sales.index[sales > 10].tolist()
+    notselling_designs = sales.index[sales < 10].tolist()
+    return reorder_designs, notselling_designs
+
+@st.cache_data(ttl=3600, max_entries=5, show_spinner=False)
+def classify_listings(_shopify_df, _external_sources, source_names, version):
+    shopify_designs = _shopify_df["Design No"].unique().tolist()
+    # Combine Warehouse and EBO stock per (Design No, Barcode)
+    external_df = (
+        pd.concat(
+            [df[["Design No", "Barcode", "Closing Qty"]] for _, df in _external_sources],
+            ignore_index=True,
+        )
+        .groupby(["Design No", "Barcode"], sort=False, observed=True)["Closing Qty"].sum()
+        .reset_index()
+    )
+    # Exact Design No / Barcode hits first, compared on the shared category codes;
+    # fuzzy-match only the residual in one batch. Plain ratio (bit-parallel InDel)
+    # keeps this cross-product cheap; Search keeps WRatio for free-form queries.
+    exact_mask = (
+        np.isin(external_df["Design No"].cat.codes, _shopify_df["Design No"].cat.codes.unique())
+        | np.isin(external_df["Barcode"].cat.codes, _shopify_df["Barcode"].cat.codes.unique())
+    )
+    exact = external_df[exact_mask].assign(**{"Match Type": "Exact"})
+    residual = external_df[~exact_mask]
+    best_scores = np.zeros(len(residual), dtype=np.uint8)
+    if len(residual) and len(shopify_designs):
+        # Score each distinct design once, then expand back to the residual rows
+        codes, residual_designs = pd.factorize(residual["Design No"])
+        scores = process.cdist(
+            np.asarray(residual_designs, dtype=object), shopify_designs,
+            scorer=fuzz.ratio, score_cutoff=80, workers=-1, dtype=np.uint8
+        )
+        best_scores = scores.max(axis=1)[codes]
+    fuzzy_mask = best_scores >= 80
+    fuzzy = residual[fuzzy_mask].assign(**{"Match Type": [f"Fuzzy ({s})" for s in best_scores[fuzzy_mask]]})
+    listed_df = pd.concat([exact, fuzzy]).sort_index().reset_index(drop=True)
+    nonlisted_df = residual[~fuzzy_mask].reset_index(drop=True)
+    return listed_df, nonlisted_df
+
+def fuzzy_best_match(query, choices, choices_set=None, score_cutoff=None):
     if not query or not len(choices):
         return None, 0
-    match = process.extractOne(query, choices, scorer=fuzz.WRatio)
+    # Exact hits skip the scorer
+    if choices_set is not None and query in choices_set:
+        return query, 100
+    match = process.extractOne(query, choices, scorer=fuzz.WRatio, score_cutoff=score_cutoff)
     if match:
         return match[0], match[1]
     return None, 0
 
+# Search lookups are keyed on (sheet_name, version); the underscored frame is not hashed
+@st.cache_data(ttl=3600, max_entries=20, show_spinner=False)
+def build_qty_indexes(_df, sheet_name, version):
+    barcode_qty = _df.groupby("Barcode", sort=False, observed=True)["Closing Qty"].sum().to_dict()
+    design_qty = _df.groupby("Design No", sort=False, observed=True)["Closing Qty"].sum().to_dict()
+    return barcode_qty, design_qty
+
+@st.cache_data(ttl=3600, max_entries=20, show_spinner=False)
+def build_cdn_indexes(_df, sheet_name, version):
+    # First CDN link per key, as the previous .iloc[0] lookups returned
+    barcode_cdn = _df.groupby("Barcode", sort=False, observed=True)["CDN link"].first().to_dict()
+    design_cdn = _df.groupby("Design No", sort=False, observed=True)["CDN link"].first().to_dict()
+    return barcode_cdn, design_cdn
+
+@st.cache_data(ttl=3600, max_entries=20, show_spinner=False)
+def design_choices(_df, sheet_name, version):
+    return _df["Design No"].unique().tolist()
+
+@st.cache_data(ttl=3600, max_entries=20, show_spinner=False)
+def design_set(_df, sheet_name, version):
+    return frozenset(design_choices(_df, sheet_name, version))
+
+# ---- Helpers for Google Drive ----
+@st.cache_data(ttl=600, show_spinner=False)
+def _load_drive_index(folder_id):
+    service = get_drive_service()
+    files, page_token = [], None
+    while True:
+        response = service.files().list(
+            q=f"'{folder_id}' in parents and trashed=false",
+            pageSize=1000,
+            fields="nextPageToken, files(id, name)",
+            pageToken=page_token,
+        ).execute()
+        files.extend(response.get("files", []))
+        page_token = response.get("nextPageToken")
+        if not page_token:
+            return build_drive_index(files)
+
+def load_drive_index(folder_id):
+    try:
+        return _load_drive_index(folder_id)
+    except Exception as e:
+        st.error(f"Error listing Drive folder: {e}")
+        return None
+
+def build_drive_index(files):
+    # Lowercased file stems, their words and alphanumeric tokens, sorted for prefix search,
+    # each with the first file id seen for it
+    index = {}
+    for f in files:
+        stem = f["name"].lower().rsplit(".", 1)[0]
+        for key in [stem] + stem.split() + re.findall(r"[a-z0-9]+", stem):
+            index.setdefault(key, f["id"])
+    keys = sorted(index)
+    tokens = np.array(keys, dtype=str)
+    token_ids = np.array([index[key] for key in keys], dtype=object)
+    return tokens, token_ids
+
+def find_drive_files(designs, tokens, token_ids):
+    # Prefix match on name tokens, like Drive's `name contains`; `designs` must be lowercased.
+    # If any token starts with a design, the first token sorting at or after it does
+    # (the design itself on an exact hit), so one searchsorted answers every design.
+    file_ids = np.full(len(designs), None, dtype=object)
+    if len(tokens) and len(designs):
+        pos = np.minimum(np.searchsorted(tokens, designs), len(tokens) - 1)
+        hits = np.char.startswith(tokens[pos], designs)
+        file_ids[hits] = token_ids[pos[hits]]
+    return file_ids
+
 # ---- Required Sheets ----
-REQ_SHOPIFY = ["Barcode", "Design No", "Closing Qty", "CDN link"]
-REQ_WAREHOUSE = ["Barcode", "Design No", "Closing Qty"]
-REQ_EBO = ["Barcode", "Design No", "Closing Qty"]
-REQ_ORDERS = ["Design No", "Quantity", "Created at"]
+SHEET_NAMES = ("Shopify", "Warehouse", "EBO", "Orders")
+# Column dtypes applied by the sheet loader wherever the column is present
+KEY_COLS = ("Design No", "Barcode")
+QTY_COLS = ("Closing Qty", "Quantity")
+DATE_COLS = ("Created at",)
+REQ_SHOPIFY = ("Barcode", "Design No", "Closing Qty", "CDN link")
+REQ_WAREHOUSE = ("Barcode", "Design No", "Closing Qty")
+REQ_EBO = ("Barcode", "Design No", "Closing Qty")
+REQ_ORDERS = ("Design No", "Quantity", "Created at")
 
 # ---- Load from Google Sheets ----
-shopify_df = fetch_sheet_df("Shopify", REQ_SHOPIFY, "Shopify")
-warehouse_df = fetch_sheet_df("Warehouse", REQ_WAREHOUSE, "Warehouse")
-ebo_df = fetch_sheet_df("EBO", REQ_EBO, "EBO")
-orders_df = fetch_sheet_df("Orders", REQ_ORDERS, "Orders")
+if st.sidebar.button("🔄 Refresh data"):
+    _spreadsheet_modified_time.clear()
+    _fetch_sheet_values.clear()
+    _load_sheet_df.clear()
+    _load_drive_index.clear()
+    build_qty_indexes.clear()
+    build_cdn_indexes.clear()
+    design_choices.clear()
+    design_set.clear()
+    build_inventory_overview.clear()
+    classify_recent_sales.clear()
+    classify_listings.clear()
+sheet_version = spreadsheet_version()
+shopify_df = fetch_sheet_df("Shopify", REQ_SHOPIFY, "Shopify", sheet_version)
+warehouse_df = fetch_sheet_df("Warehouse", REQ_WAREHOUSE, "Warehouse", sheet_version)
+ebo_df = fetch_sheet_df("EBO", REQ_EBO, "EBO", sheet_version)
+orders_df = fetch_sheet_df("Orders", REQ_ORDERS, "Orders", sheet_version)
+align_categories([shopify_df, warehouse_df, ebo_df], ["Design No", "Barcode"])
 
 st.title("📦 Inventory Dashboard — Shopify + Warehouse + EBO")
 
@@ -89,16 +319,7 @@ col4.metric("Overall Qty", overall_total)
 # ---- Sales Trends (Reorder / Not Selling) ----
 reorder_designs, notselling_designs = [], []
 if orders_df is not None:
-    max_date = orders_df["Created at"].max()
-    if pd.notnull(max_date):
-        cutoff = max_date - timedelta(days=3)
-        recent = orders_df[orders_df["Created at"] >= cutoff]
-        sales = recent.groupby("Design No")["Quantity"].sum().reset_index()
-        for _, row in sales.iterrows():
-            if row["Quantity"] > 10:
-                reorder_designs.append(row["Design No"])
-            elif row["Quantity"] < 10:
-                notselling_designs.append(row["Design No"])
+    reorder_designs, notselling_designs = classify_recent_sales(orders_df, sheet_version)
 col5.metric("Reorder Designs (sales > 10, last 3d)", len(reorder_designs))
 col6.metric("Not Selling (sales < 10, last 3d)", len(notselling_designs))
 
@@ -114,54 +335,49 @@ tab1, tab2, tab3, tab4 = st.tabs([
 with tab1:
     if shopify_df is not None or warehouse_df is not None or ebo_df is not None:
         st.subheader("Inventory Overview")
-        combined = []
-        for label, df in [("Warehouse", warehouse_df), ("Shopify", shopify_df), ("EBO", ebo_df)]:
-            if df is not None:
-                # Include missing columns if not found
-                for col in ["Color", "Size"]:
-                    if col not in df.columns:
-                        df[col] = ""
-                agg = df.groupby(["Design No", "Barcode", "Color", "Size"], dropna=False)["Closing Qty"].sum().reset_index()
-                agg.rename(columns={"Closing Qty": f"{label}_Qty"}, inplace=True)
-                combined.append(agg)
-        if combined:
-            merged = combined[0]
-            for part in combined[1:]:
-                merged = merged.merge(part, on=["Design No", "Barcode", "Color", "Size"], how="outer")
-            merged = merged.fillna(0)
-            qty_cols = [c for c in merged.columns if c.endswith("_Qty")]
-            merged["Total_QTY"] = merged[qty_cols].sum(axis=1)
-            st.dataframe(
-                merged[["Design No", "Barcode", "Color", "Size"] + qty_cols + ["Total_QTY"]]
-                .sort_values("Total_QTY", ascending=False)
-                .head(50)
-            )
-            # Top 20 Designs by Inventory
+        sources = [(label, df) for label, df in [("Warehouse", warehouse_df), ("Shopify", shopify_df), ("EBO", ebo_df)] if df is not None]
+        merged, qty_cols = build_inventory_overview(sources, tuple(label for label, _ in sources), sheet_version)
+        if not merged.empty:
+            top50 = merged.nlargest(50, "Total_QTY")
+            st.dataframe(top50[["Design No", "Barcode", "Color", "Size"] + qty_cols + ["Total_QTY"]])
+            # Top 20 Designs by Inventory, one bar per design across its barcodes/colors/sizes
             st.subheader("Top 20 Designs by Inventory")
-            top20 = merged.sort_values("Total_QTY", ascending=False).head(20)
-            fig, ax = plt.subplots(figsize=(10,5))
-            ax.bar(top20["Design No"], top20["Total_QTY"], color="skyblue")
-            ax.set_xlabel("Design No")
-            ax.set_ylabel("Total Inventory")
-            ax.set_title("Top 20 Designs by Inventory")
-            plt.xticks(rotation=45, ha="right")
-            st.pyplot(fig)
+            top20 = (
+                merged.groupby("Design No", sort=False, observed=True)["Total_QTY"].sum()
+                .nlargest(20)
+                .reset_index()
+            )
+            st.bar_chart(
+                top20, x="Design No", y="Total_QTY", x_label="Design No", y_label="Total Inventory",
+                sort="-Total_QTY", height=400,
+            )
 
 # ---- Search Tab ----
-with tab2:
+# Runs as a fragment so submitting a search reruns only this tab
+@st.fragment
+def render_search_tab():
     st.subheader("Search by Design No or Barcode")
-    query = st.text_input("Enter Design No or Barcode")
+    # Inside a form the query only updates on submit, not on every keystroke
+    with st.form("search_form", clear_on_submit=False):
+        query = st.text_input("Enter Design No or Barcode")
+        st.form_submit_button("Search")
     if query:
         results = []
-        for label, df in [("Warehouse", warehouse_df), ("Shopify", shopify_df), ("EBO", ebo_df)]:
+        design_matches = {}
+        sources = [("Warehouse", warehouse_df), ("Shopify", shopify_df), ("EBO", ebo_df)]
+        for label, df in sources:
             qty = 0
             if df is not None:
-                if "Barcode" in df.columns and query in df["Barcode"].values:
-                    qty = df[df["Barcode"] == query]["Closing Qty"].sum()
+                barcode_qty, design_qty = build_qty_indexes(df, label, sheet_version)
+                if query in barcode_qty:
+                    qty = barcode_qty[query]
                 else:
-                    match, score = fuzzy_best_match(query, df["Design No"].unique())
+                    match = design_matches[label] = fuzzy_best_match(
+                        query, design_choices(df, label, sheet_version), design_set(df, label, sheet_version),
+                        score_cutoff=60,
+                    )[0]
                     if match:
-                        qty = df[df["Design No"] == match]["Closing Qty"].sum()
+                        qty = design_qty[match]
             results.append({"Source": label, "Qty": int(qty)})
         total = sum(r["Qty"] for r in results)
         results.append({"Source": "Total", "Qty": total})
@@ -169,17 +385,22 @@ with tab2:
         # Show CDN image
         cdn = None
         if shopify_df is not None:
-            if "Barcode" in shopify_df.columns and query in shopify_df["Barcode"].values:
-                cdn = shopify_df.loc[shopify_df["Barcode"] == query, "CDN link"].iloc[0]
+            barcode_cdn, design_cdn = build_cdn_indexes(shopify_df, "Shopify", sheet_version)
+            if query in barcode_cdn:
+                cdn = barcode_cdn[query]
             else:
-                match, _ = fuzzy_best_match(query, shopify_df["Design No"].unique())
+                # Reuse the Shopify match from the quantity lookup above
+                match = design_matches.get("Shopify")
                 if match:
-                    cdn = shopify_df.loc[shopify_df["Design No"] == match, "CDN link"].iloc[0]
+                    cdn = design_cdn.get(match)
         if cdn:
             st.image(cdn, caption=f"Design {query}")
         else:
             st.warning("No CDN link found in Shopify for this design.")
 
+with tab2:
+    render_search_tab()
+
 # ---- Sales Trends Tab ----
 with tab3:
     st.subheader("📈 Sales Trends (last 3 days)")
@@ -205,52 +426,10 @@ with tab4:
     elif warehouse_df is None and ebo_df is None:
         st.warning("Warehouse/EBO sheets missing.")
     else:
-        shopify_designs = set(shopify_df["Design No"].astype(str).tolist())
-        shopify_barcodes = set(shopify_df["Barcode"].astype(str).tolist())
-        external_df_list = []
-        if warehouse_df is not None:
-            external_df_list.append(warehouse_df[["Design No", "Barcode", "Closing Qty"]])
-        if ebo_df is not None:
-            external_df_list.append(ebo_df[["Design No", "Barcode", "Closing Qty"]])
-        external_df = pd.concat(external_df_list, ignore_index=True).drop_duplicates()
-        listed = []
-        nonlisted = []
-        for _, row in external_df.iterrows():
-            d = str(row.get("Design No", ""))
-            b = str(row.get("Barcode", ""))
-            closing_qty = row.get("Closing Qty", 0)
-            if (d in shopify_designs) or (b in shopify_barcodes):
-                listed.append({
-                    "Design No": d,
-                    "Barcode": b,
-                    "Closing Qty": closing_qty,
-                    "Match Type": "Exact"
-                })
-            else:
-                match_data = process.extractOne(d, shopify_designs)
-                if match_data:
-                    match, score = match_data[0], match_data[1]
-                    if score >= 80:
-                        listed.append({
-                            "Design No": d,
-                            "Barcode": b,
-                            "Closing Qty": closing_qty,
-                            "Match Type": f"Fuzzy ({score})"
-                        })
-                    else:
-                        nonlisted.append({
-                            "Design No": d,
-                            "Barcode": b,
-                            "Closing Qty": closing_qty
-                        })
-                else:
-                    nonlisted.append({
-                        "Design No": d,
-                        "Barcode": b,
-                        "Closing Qty": closing_qty
-                    })
-        listed_df = pd.DataFrame(listed)
-        nonlisted_df = pd.DataFrame(nonlisted)
+        external_sources = [(label, df) for label, df in [("Warehouse", warehouse_df), ("EBO", ebo_df)] if df is not None]
+        listed_df, nonlisted_df = classify_listings(
+            shopify_df, external_sources, tuple(label for label, _ in external_sources), sheet_version
+        )
         c1, c2 = st.columns(2)
         c1.metric("Listed Products", len(listed_df))
         c2.metric("Non-Listed Products", len(nonlisted_df))
@@ -270,29 +449,21 @@ with tab4:
 tab5 = st.tabs(["📷 Image Availability"])[0]
 with tab5:
     st.header("📷 Check Image Availability from Google Drive")
+    drive_index = None
     if warehouse_df is None or warehouse_df.empty or not DRIVE_FOLDER_ID:
         st.warning("Warehouse sheet/Drive folder missing.")
     else:
-        service = build("drive", "v3", credentials=creds)
+        drive_index = load_drive_index(DRIVE_FOLDER_ID)
+    if drive_index is not None:
         designs = warehouse_df["Design No"].dropna().astype(str).unique()
-        image_data = []
-        for design in designs:
-            query = f"'{DRIVE_FOLDER_ID}' in parents and name contains '{design}' and trashed=false"
-            try:
-                response = service.files().list(q=query, pageSize=1, fields="files(id, name)").execute()
-                files = response.get("files", [])
-                if files:
-                    file_id = files[0]["id"]
-                    url = f"https://drive.google.com/uc?export=view&id={file_id}"
-                    status = "✅ Available"
-                else:
-                    url = ""
-                    status = "❌ Not Available"
-            except Exception as e:
-                url = ""
-                status = f"❌ Error: {e}"
-            image_data.append({"Design No": design, "Image Status": status, "Image URL": url})
-        availability_df = pd.DataFrame(image_data)
+        tokens, token_ids = drive_index
+        file_ids = find_drive_files(np.char.lower(np.asarray(designs, dtype=str)), tokens, token_ids)
+        available = pd.notna(file_ids)
+        availability_df = pd.DataFrame({
+            "Design No": designs,
+            "Image Status": np.where(available, "✅ Available", "❌ Not Available"),
+            "Image URL": np.where(available, np.char.add("https://drive.google.com/uc?export=view&id=", file_ids.astype(str)), ""),
+        })
         st.write("### Image Availability Status")
         st.dataframe(availability_df)
         # Optionally show missing images only